@@ -0,0 +1,131 @@
+"""In-memory replica of the campaign database.
+
+This module keeps a copy of the on-disk SQLite database in a shared-cache
+in-memory database, so that serving queries never touch disk I/O. The
+copy is taken with the SQLite backup API and refreshed in the background.
+"""
+
+import itertools
+import pathlib
+import sqlite3
+import threading
+import time
+
+from .utils import get_database_signature
+
+
+class SQLiteReplica:
+    """Shared-cache in-memory copy of a SQLite database file.
+
+    Every refresh backs the file up into a freshly named in-memory
+    database and then swaps it in, so readers always see a complete
+    copy. Connections opened before a swap keep reading the previous
+    copy until they are closed. Each copy gets a new `generation`, so data
+    derived from a copy can tell when it was replaced.
+    """
+
+    _ids = itertools.count()
+
+    def __init__(
+        self,
+        path: str,
+        poll_interval: float = 1.0,
+        refresh_interval: float | None = None,
+    ):
+        """Init.
+
+        Args:
+            path (str): The database file to replicate.
+            poll_interval (float): Seconds between checks for file changes.
+            refresh_interval (float | None): Seconds after which the copy is
+                refreshed even if the file looks unchanged. None disables it.
+        """
+        self.path = path
+        self.poll_interval = poll_interval
+        self.refresh_interval = refresh_interval
+        self.last_error: Exception | None = None
+        self.name = f"ads_campaigns_replica_{next(self._ids)}"
+        self.generation = -1
+        self._generations = itertools.count()
+        self._lock = threading.Lock()
+        self._uri: str | None = None
+        self._keeper: sqlite3.Connection | None = None
+        self._signature: tuple | None = None
+        self._refreshed_at = 0.0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def refresh(self):
+        """Copy the database file into a new in-memory database and swap it in."""
+        signature = get_database_signature(self.path)
+        generation = next(self._generations)
+        uri = f"file:{self.name}_{generation}?mode=memory&cache=shared"
+        keeper = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        try:
+            path_uri = pathlib.Path(self.path).absolute().as_uri()
+            source = sqlite3.connect(f"{path_uri}?mode=ro", uri=True)
+            try:
+                source.backup(keeper)
+            finally:
+                source.close()
+        except BaseException:
+            keeper.close()
+            raise
+
+        with self._lock:
+            old, self._keeper, self._uri = self._keeper, keeper, uri
+            self.generation = generation
+            self._signature = signature
+            self._refreshed_at = time.monotonic()
+        if old is not None:
+            old.close()
+
+    def is_stale(self) -> bool:
+        """Return whether the file or its WAL changed, or a refresh is due."""
+        if self._signature != get_database_signature(self.path):
+            return True
+        if self.refresh_interval is None:
+            return False
+        return time.monotonic() - self._refreshed_at >= self.refresh_interval
+
+    def connect(self) -> sqlite3.Connection:
+        """Open a read-only connection to the current in-memory copy."""
+        return self.connect_generation()[0]
+
+    def connect_generation(self) -> tuple[sqlite3.Connection, int]:
+        """Open a read-only connection and return it with its copy's generation."""
+        # The lock keeps the copy alive until the new connection holds it.
+        with self._lock:
+            if self._uri is None:
+                raise RuntimeError("Replica has not been loaded")
+            conn = sqlite3.connect(self._uri, uri=True)
+            generation = self.generation
+        conn.execute("PRAGMA query_only = ON")
+        return conn, generation
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                if self.is_stale():
+                    self.refresh()
+            except (OSError, sqlite3.Error) as exc:
+                # Keep serving the previous copy until the file is readable.
+                self.last_error = exc
+
+    def start(self):
+        """Load the copy and start refreshing it in the background."""
+        self.refresh()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop refreshing and drop the in-memory copy."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            keeper, self._keeper, self._uri = self._keeper, None, None
+        if keeper is not None:
+            keeper.close()
@@ -15,3 +15,13 @@ Note:
 DB_PATH = (
     "src/ads_campaigns/campaign.db"  # Can be set via environment variable if needed
 )
+
+CLICK_RANKING = "exact"  # "exact" or "approximate" (bounded-memory heavy hitters)
+
+REPLICA_ENABLED = False  # Load DB_PATH into an in-memory replica at import time
+
+HEAVY_HITTERS_EPSILON = 0.001  # Max click overestimation, as a fraction of clicks
+
+REPLICA_POLL_INTERVAL = 1.0  # Seconds between checks of DB_PATH for changes
+
+REPLICA_REFRESH_INTERVAL = 300.0  # Seconds before the replica is reloaded anyway
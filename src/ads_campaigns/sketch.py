@@ -0,0 +1,93 @@
+"""Bounded-memory frequency estimation.
+
+This module contains streaming structures that rank items by frequency
+in fixed memory, regardless of how many distinct items the stream has.
+"""
+
+import heapq
+import math
+from collections.abc import Hashable, Iterable
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitters sketch (Metwally et al.).
+
+    Tracks at most `ceil(1 / epsilon)` counters. Every estimated count
+    overestimates the true count by at most `epsilon * total`, and any
+    item occurring more than `epsilon * total` times is guaranteed to be
+    tracked. While the number of distinct items fits in the counters no
+    eviction happens and the counts are exact.
+    """
+
+    def __init__(self, epsilon: float = 0.001):
+        """Init.
+
+        Args:
+            epsilon (float): Maximum overestimation as a fraction of the
+                total number of updates.
+        """
+        if not 0 < epsilon < 1:
+            raise ValueError("epsilon must be in (0, 1)")
+        self.capacity = math.ceil(1 / epsilon)
+        self.total = 0
+        self.exact = True
+        self._counts: dict[Hashable, int] = {}
+        self._errors: dict[Hashable, int] = {}
+        self._heap: list[tuple[int, Hashable]] = []
+
+    def _pop_min(self) -> tuple[int, Hashable]:
+        while True:
+            count, item = heapq.heappop(self._heap)
+            if self._counts.get(item) == count:
+                return count, item
+
+    def _push(self, item: Hashable, count: int):
+        heapq.heappush(self._heap, (count, item))
+        # Stale heap entries are dropped periodically to keep memory bounded.
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(c, i) for i, c in self._counts.items()]
+            heapq.heapify(self._heap)
+
+    def update(self, item: Hashable, count: int = 1):
+        """Add `count` occurrences of `item`."""
+        self.total += count
+        if item in self._counts:
+            self._counts[item] += count
+        elif len(self._counts) < self.capacity:
+            self._counts[item] = count
+            self._errors[item] = 0
+        else:
+            floor, evicted = self._pop_min()
+            del self._counts[evicted]
+            del self._errors[evicted]
+            self._counts[item] = floor + count
+            self._errors[item] = floor
+            self.exact = False
+        self._push(item, self._counts[item])
+
+    def extend(self, items: Iterable[Hashable]):
+        """Add one occurrence of every item in `items`."""
+        for item in items:
+            self.update(item)
+
+    def error(self, item: Hashable) -> int:
+        """Return the maximum overestimation of `item`'s count."""
+        return self._errors.get(item, 0)
+
+    def top(
+        self, n: int, exclude: Iterable[Hashable] = ()
+    ) -> list[tuple[Hashable, int]]:
+        """Return the `n` most frequent items with their estimated counts.
+
+        Args:
+            n (int): Number of items to return.
+            exclude (Iterable): Items to leave out of the ranking.
+
+        Returns:
+            list[tuple]: `(item, count)` pairs, most frequent first.
+        """
+        skip = set(exclude)
+        candidates = (
+            (item, count) for item, count in self._counts.items() if item not in skip
+        )
+        return heapq.nlargest(n, candidates, key=lambda pair: pair[1])
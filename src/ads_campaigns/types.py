@@ -11,3 +11,11 @@ class Banner(NamedTuple):
     banner: int
     campaign: int
     quarter: int
+
+
+class SingleFlightStats(NamedTuple):
+    """Request coalescing counters."""
+
+    calls: int
+    executions: int
+    coalesced: int
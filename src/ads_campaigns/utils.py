@@ -3,7 +3,17 @@
 This module contains any generic logic that is used in the project.
 """
 
+import asyncio
+import os
+import threading
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future
 from datetime import datetime
+from typing import Any, TypeVar
+
+from .types import SingleFlightStats
+
+T = TypeVar("T")
 
 
 def get_hours_quarter(time: datetime = datetime.utcnow()) -> int:
@@ -16,3 +26,117 @@ def get_hours_quarter(time: datetime = datetime.utcnow()) -> int:
         int: The quarter of the hour the time is in.
     """
     return (time.minute // 15) + 1
+
+
+def get_database_signature(path: str) -> tuple:
+    """Get a signature of a SQLite database that changes when it is written.
+
+    Covers the `-wal` file too, since in WAL mode writes land there until
+    the next checkpoint.
+
+    Args:
+        path (str): The database file to sign.
+
+    Returns:
+        tuple: Modification time in nanoseconds and size of the database
+            file and, if present, of its write-ahead log.
+    """
+    signature: tuple = ()
+    for file in (path, f"{path}-wal"):
+        try:
+            stat = os.stat(file)
+        except FileNotFoundError:
+            if file == path:
+                raise
+            continue
+        signature += (stat.st_mtime_ns, stat.st_size)
+    return signature
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one execution.
+
+    While a call for a key is in flight, further calls for the same key
+    wait for it and receive its result (or its exception) instead of
+    running the function again. Threaded callers use `do`, coroutines
+    use `ado`; both share one in-flight table, so a thread and a
+    coroutine on any event loop coalesce with each other.
+    """
+
+    def __init__(self):
+        """Init."""
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future] = {}
+        self._total = 0
+        self._executions = 0
+
+    def _join(self, key: Hashable) -> tuple[Future, bool]:
+        """Return the in-flight future for `key` and whether we lead it."""
+        with self._lock:
+            self._total += 1
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            self._executions += 1
+        # A running future cannot be cancelled by a single waiter.
+        future.set_running_or_notify_cancel()
+        return future, True
+
+    def _run(self, key: Hashable, future: Future, fn: Callable[[], Any]):
+        try:
+            result = fn()
+        except BaseException as exc:
+            with self._lock:
+                del self._calls[key]
+            future.set_exception(exc)
+        else:
+            with self._lock:
+                del self._calls[key]
+            future.set_result(result)
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """Run `fn` once for all concurrent callers of `key`.
+
+        Args:
+            key (Hashable): Identifies calls that may share a result.
+            fn (Callable): The computation to run.
+
+        Returns:
+            The result of the single in-flight execution of `fn`.
+        """
+        future, leader = self._join(key)
+        if leader:
+            self._run(key, future, fn)
+        return future.result()
+
+    async def ado(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """Async variant of `do`; `fn` runs in a worker thread.
+
+        Args:
+            key (Hashable): Identifies calls that may share a result.
+            fn (Callable): The blocking computation to run.
+
+        Returns:
+            The result of the single in-flight execution of `fn`.
+        """
+        future, leader = self._join(key)
+        if leader:
+            await asyncio.to_thread(self._run, key, future, fn)
+        return await asyncio.wrap_future(future)
+
+    @property
+    def stats(self) -> SingleFlightStats:
+        """Snapshot of how many calls were made, executed and coalesced."""
+        with self._lock:
+            return SingleFlightStats(
+                calls=self._total,
+                executions=self._executions,
+                coalesced=self._total - self._executions,
+            )
+
+    def reset_stats(self):
+        """Reset the call counters."""
+        with self._lock:
+            self._total = 0
+            self._executions = 0
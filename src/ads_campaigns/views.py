@@ -1,53 +1,230 @@
 """This module hosts the business logic of the application."""
 
+import os
 import random
 import sqlite3
+import threading
+from collections.abc import Hashable, Sequence
 from datetime import UTC, datetime
+from typing import Any
+
+from .replica import SQLiteReplica
+from .settings import (
+    CLICK_RANKING,
+    DB_PATH,
+    HEAVY_HITTERS_EPSILON,
+    REPLICA_ENABLED,
+    REPLICA_POLL_INTERVAL,
+    REPLICA_REFRESH_INTERVAL,
+)
+from .sketch import SpaceSaving
+from .types import Banner, SingleFlightStats
+from .utils import SingleFlight, get_database_signature, get_hours_quarter
+
+BannerRow = sqlite3.Row | dict[str, Any]
+
+_campaign_flight = SingleFlight()
+# Click sketches of the data source `DBConnection` read from most recently.
+_click_sketches: tuple[Hashable, "ClickSketches"] | None = None
+_click_sketches_lock = threading.Lock()
+_replica: SQLiteReplica | None = None
+_replica_lock = threading.Lock()
+
+
+def start_replica(
+    poll_interval: float = REPLICA_POLL_INTERVAL,
+    refresh_interval: float | None = REPLICA_REFRESH_INTERVAL,
+):
+    """Serve reads from an in-memory copy of the database.
+
+    Called at import time when `REPLICA_ENABLED` is set. The copy is
+    refreshed in the background when `DB_PATH` changes or
+    `refresh_interval` elapses.
+    """
+    global _replica
+    with _replica_lock:
+        if _replica is not None:
+            return
+        replica = SQLiteReplica(DB_PATH, poll_interval, refresh_interval)
+        replica.start()
+        _replica = replica
+
+
+def stop_replica():
+    """Go back to reading the database file directly."""
+    global _replica
+    with _replica_lock:
+        replica, _replica = _replica, None
+    if replica is not None:
+        replica.stop()
+
 
-from .settings import DB_PATH
-from .types import Banner
-from .utils import get_hours_quarter
+def _click_sketches_for(source: Hashable) -> "ClickSketches":
+    """Return the click sketches of `source`, dropping those of older sources."""
+    global _click_sketches
+    with _click_sketches_lock:
+        if _click_sketches is None or _click_sketches[0] != source:
+            _click_sketches = (source, ClickSketches())
+        return _click_sketches[1]
 
 
 class DBConnection:
-    """Database connection context manager."""
+    """Database connection context manager.
+
+    `source` identifies the data the connection reads, and changes
+    whenever that data may have changed.
+    """
 
     def __init__(self):
         """Init."""
         self.conn = None
+        self.source: Hashable = None
 
     def __enter__(self):
         """Enter."""
-        self.conn = sqlite3.connect(DB_PATH)
+        self.conn = self._connect()
         self.conn.row_factory = sqlite3.Row
         return self.conn
 
+    def _connect(self) -> sqlite3.Connection:
+        replica = _replica
+        if replica is not None:
+            try:
+                conn, generation = replica.connect_generation()
+            except RuntimeError:
+                pass  # The replica was stopped meanwhile; read from disk.
+            else:
+                self.source = (replica.name, generation)
+                return conn
+        self.source = (os.path.abspath(DB_PATH), get_database_signature(DB_PATH))
+        return sqlite3.connect(DB_PATH)
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Exit."""
         if self.conn:
             self.conn.close()
 
 
+class _ClickSketch:
+    """Space-Saving sketch of one (campaign, quarter) and its read position."""
+
+    query = """
+        SELECT rowid, banner_id
+        FROM Clicks
+        WHERE rowid > ? AND campaign_id = ? AND quarter = ?
+        ORDER BY rowid
+    """
+
+    def __init__(self, epsilon: float):
+        """Init."""
+        self.lock = threading.Lock()
+        self.epsilon = epsilon
+        self.sketch = SpaceSaving(epsilon)
+        self.last_rowid = 0
+
+    def top(
+        self,
+        cur: sqlite3.Cursor,
+        campaign_id: int,
+        quarter: int,
+        n: int,
+        exclude: list[int],
+    ) -> list[tuple[Hashable, int]]:
+        """Read the clicks added since the last call and rank the banners."""
+        with self.lock:
+            cur.execute("SELECT MAX(rowid) FROM Clicks")
+            if (cur.fetchone()[0] or 0) < self.last_rowid:
+                # Rows were removed, so the counts can't be trusted anymore.
+                self.sketch = SpaceSaving(self.epsilon)
+                self.last_rowid = 0
+            cur.execute(self.query, (self.last_rowid, campaign_id, quarter))
+            for rowid, banner_id in cur:
+                self.sketch.update(banner_id)
+                self.last_rowid = rowid
+            return self.sketch.top(n, exclude)
+
+
+class ClickSketches:
+    """Click sketches of one data source, per (campaign, quarter, epsilon).
+
+    Each sketch remembers the last click rowid it read, so later calls only
+    read newer clicks. A sketch is rebuilt when the `Clicks` table shrinks
+    below that rowid. Any other change to the data needs a new instance.
+    """
+
+    def __init__(self):
+        """Init."""
+        self._lock = threading.Lock()
+        self._sketches: dict[tuple[int, int, float], _ClickSketch] = {}
+
+    def top(
+        self,
+        cur: sqlite3.Cursor,
+        campaign_id: int,
+        quarter: int,
+        epsilon: float,
+        n: int,
+        exclude: list[int],
+    ) -> list[tuple[Hashable, int]]:
+        """Return the top `n` banners by estimated clicks with their counts."""
+        key = (campaign_id, quarter, epsilon)
+        # Only lookups hold the shared lock; each sketch is read under its own.
+        with self._lock:
+            sketch = self._sketches.get(key)
+            if sketch is None:
+                sketch = self._sketches[key] = _ClickSketch(epsilon)
+        return sketch.top(cur, campaign_id, quarter, n, exclude)
+
+
 class BannerSelectorSQL:
     """Retrieve Banners from DB."""
 
-    def __init__(self, connection: sqlite3.Connection):
-        """Init."""
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        click_ranking: str = CLICK_RANKING,
+        epsilon: float = HEAVY_HITTERS_EPSILON,
+        quarter: int | None = None,
+        sketches: ClickSketches | None = None,
+    ):
+        """Init.
+
+        Args:
+            connection (sqlite3.Connection): Database to read banners from.
+            click_ranking (str): "exact" to rank banners by clicks in SQL, or
+                "approximate" to use a bounded-memory heavy-hitters sketch.
+            epsilon (float): Error bound of the approximate click ranking.
+            quarter (int | None): Quarter of the hour to select banners for.
+                Defaults to the current quarter at the time of each query.
+            sketches (ClickSketches | None): Click sketches of the data behind
+                `connection`, shared across selectors. Defaults to sketches
+                private to this selector.
+        """
+        if click_ranking not in ("exact", "approximate"):
+            raise ValueError(f"Unknown click ranking: {click_ranking!r}")
         self.con = connection
         self.cur = connection.cursor()
-
-    def _execute_query(self, query: str, params: tuple = ()) -> list[int]:
+        self.click_ranking = click_ranking
+        self.epsilon = epsilon
+        self.quarter = quarter
+        self.sketches = sketches
+        self._own_sketches = ClickSketches()
+        self._data_version = None
+
+    def _execute_query(self, query: str, params: tuple = ()) -> list[sqlite3.Row]:
         self.cur.execute(query, params)
         return [row for row in self.cur.fetchall()]
 
     @property
     def current_quarter(self):
-        """Get current quarter of the hour."""
+        """Get the quarter of the hour to select banners for."""
+        if self.quarter is not None:
+            return self.quarter
         return get_hours_quarter(datetime.now(UTC))
 
     def _get_top_by_revenue(
         self, campaign_id: int, n: int, exclude: list[int]
-    ) -> list[int]:
+    ) -> list[sqlite3.Row]:
         """Returns top N banners by revenue, excluding specified banners."""
         placeholders = ",".join("?" for _ in exclude)
         query = f"""
@@ -69,17 +246,19 @@ class BannerSelectorSQL:
 
     def _get_top_by_clicks(
         self, campaign_id: int, n: int, exclude: list[int]
-    ) -> list[int]:
+    ) -> Sequence[BannerRow]:
         """Returns top N banners by click count, excluding specified banners."""
+        if self.click_ranking == "approximate":
+            return self._get_top_by_clicks_approx(campaign_id, n, exclude)
         placeholders = ",".join("?" for _ in exclude)
         query = f"""
             SELECT
                 banner_id,
                 COUNT(click_id) as clicks,
                 campaign_id,
-                quarter,
+                quarter
             FROM Clicks
-            WHERE campaign_id = ? AND c.quarter = ?
+            WHERE campaign_id = ? AND quarter = ?
             AND banner_id NOT IN ({placeholders})
             GROUP BY banner_id
             ORDER BY COUNT(click_id) DESC
@@ -88,19 +267,55 @@ class BannerSelectorSQL:
         params = (campaign_id, self.current_quarter, *exclude, n)
         return self._execute_query(query, params)
 
+    def _get_top_by_clicks_approx(
+        self, campaign_id: int, n: int, exclude: list[int]
+    ) -> list[BannerRow]:
+        """Returns top N banners by estimated click count, in fixed memory.
+
+        Each (campaign, quarter) keeps a Space-Saving sketch across calls, so
+        memory depends on `epsilon` instead of the number of distinct banners,
+        and a call only reads the clicks added since the previous one. Campaigns
+        with fewer distinct banners than the sketch capacity get exact counts.
+        """
+        quarter = self.current_quarter
+        top = self._connection_sketches().top(
+            self.cur, campaign_id, quarter, self.epsilon, n, exclude
+        )
+        return [
+            {
+                "banner_id": banner_id,
+                "clicks": clicks,
+                "campaign_id": campaign_id,
+                "quarter": quarter,
+            }
+            for banner_id, clicks in top
+        ]
+
+    def _connection_sketches(self) -> ClickSketches:
+        if self.sketches is not None:
+            return self.sketches
+        # Private sketches are dropped when another connection writes.
+        version = self.con.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._own_sketches = ClickSketches()
+            self._data_version = version
+        return self._own_sketches
+
     def _get_random_banners(
         self, campaign_id: int, n: int, exclude: list[int]
-    ) -> list[int]:
+    ) -> list[sqlite3.Row]:
         """Returns N random banners, excluding specified banners."""
         placeholders = ",".join("?" for _ in exclude)
         query = f"""
-            SELECT DISTINCT banner_id
+            SELECT
+                banner_id,
                 COUNT(click_id) as clicks,
                 campaign_id,
-                quarter,
+                quarter
             FROM Clicks
-            WHERE campaign_id = ? AND c.quarter = ?
+            WHERE campaign_id = ? AND quarter = ?
             AND banner_id NOT IN ({placeholders})
+            GROUP BY banner_id
             ORDER BY RANDOM()
             LIMIT ?
         """
@@ -109,10 +324,18 @@ class BannerSelectorSQL:
 
     def get_campaign_banners(
         self, campaign_id: int, seen_banners: list[int] = []
+    ) -> list[Banner]:
+        """Determines which banners to show for a campaign, in random order."""
+        banners = self.select_campaign_banners(campaign_id, seen_banners)
+        random.shuffle(banners)
+        return banners
+
+    def select_campaign_banners(
+        self, campaign_id: int, seen_banners: list[int] = []
     ) -> list[Banner]:
         """Determines which banners to show for a campaign based on business rules."""
         exclude_banners = seen_banners if seen_banners else [-1]
-        final_banners = []
+        final_banners: list[BannerRow] = []
 
         # Calculate X (number of banners with conversions)
         query_x = """
@@ -126,10 +349,14 @@ class BannerSelectorSQL:
 
         # Apply Business Rules
         if X >= 10:
-            final_banners = self._get_top_by_revenue(campaign_id, 10, exclude_banners)
+            final_banners.extend(
+                self._get_top_by_revenue(campaign_id, 10, exclude_banners)
+            )
 
         elif 5 <= X < 10:
-            final_banners = self._get_top_by_revenue(campaign_id, X, exclude_banners)
+            final_banners.extend(
+                self._get_top_by_revenue(campaign_id, X, exclude_banners)
+            )
 
         elif 1 <= X < 5:
             revenue_banners = self._get_top_by_revenue(campaign_id, X, exclude_banners)
@@ -137,7 +364,9 @@ class BannerSelectorSQL:
 
             needed = 5 - len(final_banners)
             if needed > 0:
-                current_exclude = exclude_banners + final_banners
+                current_exclude = exclude_banners + [
+                    row["banner_id"] for row in final_banners
+                ]
                 click_banners = self._get_top_by_clicks(
                     campaign_id, needed, current_exclude
                 )
@@ -149,7 +378,9 @@ class BannerSelectorSQL:
 
             needed = 5 - len(final_banners)
             if needed > 0:
-                current_exclude = exclude_banners + final_banners
+                current_exclude = exclude_banners + [
+                    row["banner_id"] for row in final_banners
+                ]
                 random_banners = self._get_random_banners(
                     campaign_id, needed, current_exclude
                 )
@@ -158,14 +389,13 @@ class BannerSelectorSQL:
         banners = [
             Banner(
                 id=row["banner_id"],
-                click=row["clicks"] if "clicks" in row else 0,
+                click=row["clicks"] if "clicks" in row.keys() else 0,
                 banner=row["banner_id"],
                 campaign=row["campaign_id"],
                 quarter=row["quarter"],
             )
             for row in final_banners
         ]
-        random.shuffle(banners)
         return banners
 
     def get_all_banners(self):
@@ -207,13 +437,63 @@ def get_all_banners() -> list[Banner]:
     return banners
 
 
+def _select_campaign(
+    campaign: int, seen_banners: list[int], quarter: int
+) -> list[Banner]:
+    db = DBConnection()
+    with db as conn:
+        banner_selector = BannerSelectorSQL(
+            conn, quarter=quarter, sketches=_click_sketches_for(db.source)
+        )
+        banners = banner_selector.select_campaign_banners(campaign, seen_banners)
+    return banners
+
+
+def _shuffled(banners: list[Banner]) -> list[Banner]:
+    banners = list(banners)
+    random.shuffle(banners)
+    return banners
+
+
 def get_campaign(campaign: int, seen_banners: list[int] = []) -> list[Banner]:
     """Return banners for a campaign according to business rules.
 
+    Concurrent calls for the same campaign, quarter and seen banners
+    share a single database lookup; each caller gets its own shuffle.
+
     Returns:
         list[Banner]: List of all banners with their click counts and campaign info
     """
-    with DBConnection() as conn:
-        banner_selector = BannerSelectorSQL(conn)
-        banners = banner_selector.get_campaign_banners(campaign, seen_banners)
-    return banners
+    quarter = get_hours_quarter(datetime.now(UTC))
+    banners = _campaign_flight.do(
+        (campaign, quarter, frozenset(seen_banners)),
+        lambda: _select_campaign(campaign, seen_banners, quarter),
+    )
+    return _shuffled(banners)
+
+
+async def aget_campaign(campaign: int, seen_banners: list[int] = []) -> list[Banner]:
+    """Async variant of `get_campaign`.
+
+    Returns:
+        list[Banner]: List of all banners with their click counts and campaign info
+    """
+    quarter = get_hours_quarter(datetime.now(UTC))
+    banners = await _campaign_flight.ado(
+        (campaign, quarter, frozenset(seen_banners)),
+        lambda: _select_campaign(campaign, seen_banners, quarter),
+    )
+    return _shuffled(banners)
+
+
+def get_campaign_coalescing_stats() -> SingleFlightStats:
+    """Return how many `get_campaign` calls shared an in-flight lookup.
+
+    Returns:
+        SingleFlightStats: Total calls, executed lookups and coalesced calls
+    """
+    return _campaign_flight.stats
+
+
+if REPLICA_ENABLED:
+    start_replica()
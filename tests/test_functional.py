@@ -10,8 +10,17 @@ from datetime import UTC, datetime
 
 import pytest
 
+from ads_campaigns import views
+from ads_campaigns.replica import SQLiteReplica
 from ads_campaigns.utils import get_hours_quarter
-from ads_campaigns.views import get_all_banners, get_campaign
+from ads_campaigns.views import (
+    BannerSelectorSQL,
+    ClickSketches,
+    get_all_banners,
+    get_campaign,
+    start_replica,
+    stop_replica,
+)
 
 pytestmark = pytest.mark.campaign
 
@@ -388,3 +397,122 @@ def test_x_zero():
             ), "Wrong number of random banners added"
 
     conn.close()
+
+
+@pytest.mark.parametrize("campaign", range(1, 50, 7))
+def test_approximate_click_ranking(campaign):
+    """The heavy-hitters click ranking matches SQL on small campaigns."""
+    conn = sqlite3.connect("src/ads_campaigns/campaign.db")
+    conn.row_factory = sqlite3.Row
+
+    exact = BannerSelectorSQL(conn)._get_top_by_clicks(campaign, 50, [-1])
+    clicks = {row["banner_id"]: row["clicks"] for row in exact}
+    approx = BannerSelectorSQL(conn, click_ranking="approximate")
+    banners = approx._get_top_by_clicks(campaign, 5, [-1])
+
+    # Ties may be broken differently, so compare the counts.
+    assert [b["clicks"] for b in banners] == [row["clicks"] for row in exact[:5]]
+    assert all(clicks[b["banner_id"]] == b["clicks"] for b in banners)
+
+    conn.close()
+
+
+def test_campaign_from_replica():
+    """Banners served from the in-memory replica match the database file."""
+    expected = {b.banner for b in get_campaign(1)}
+    start_replica()
+    try:
+        assert {b.banner for b in get_campaign(1)} == expected
+        assert len(get_all_banners()) > 0
+    finally:
+        stop_replica()
+
+
+def _clicks_db(banners, campaign=7):
+    """Return an in-memory database with one click per banner in `banners`."""
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        "CREATE TABLE clicks"
+        " (click_id INTEGER, banner_id INTEGER, campaign_id INTEGER, quarter INTEGER)"
+    )
+    conn.execute(
+        "CREATE TABLE conversions"
+        " (conversion_id INTEGER, click_id INTEGER, revenue REAL, quarter INTEGER)"
+    )
+    _add_clicks(conn, banners, campaign)
+    return conn
+
+
+def _add_clicks(conn, banners, campaign=7):
+    insert = f"INSERT INTO clicks VALUES (?, ?, {campaign}, 1)"
+    conn.executemany(insert, enumerate(banners))
+
+
+@pytest.mark.parametrize("click_ranking", ["exact", "approximate"])
+def test_click_fill_without_conversions(click_ranking):
+    """Campaigns without conversions are filled by clicks in both modes."""
+    conn = _clicks_db([1, 1, 1, 2, 2, 3])
+    selector = BannerSelectorSQL(conn, click_ranking=click_ranking, quarter=1)
+
+    banners = selector.select_campaign_banners(7)
+    assert {b.banner: b.click for b in banners} == {1: 3, 2: 2, 3: 1}
+
+    _add_clicks(conn, [3, 3, 3])
+    banners = selector.select_campaign_banners(7)
+    assert {b.banner: b.click for b in banners} == {1: 3, 2: 2, 3: 4}
+
+    conn.close()
+
+
+def test_click_sketches_follow_their_source():
+    """Sketches never leak counts from another database."""
+    first, second = _clicks_db([1, 2, 3]), _clicks_db([8, 9])
+    for conn, expected in ((first, {1, 2, 3}), (second, {8, 9})):
+        selector = BannerSelectorSQL(
+            conn,
+            click_ranking="approximate",
+            quarter=1,
+            sketches=views._click_sketches_for(conn),
+        )
+        assert {b.banner for b in selector.select_campaign_banners(7)} == expected
+
+    first.close()
+    second.close()
+
+
+def test_click_sketches_rebuilt_after_delete():
+    """Sketches are rebuilt when clicks they counted are deleted."""
+    conn = _clicks_db([1, 2, 3])
+    sketches = ClickSketches()
+    selector = BannerSelectorSQL(
+        conn, click_ranking="approximate", quarter=1, sketches=sketches
+    )
+    assert {b.banner for b in selector.select_campaign_banners(7)} == {1, 2, 3}
+
+    conn.execute("DELETE FROM clicks WHERE banner_id = 3")
+    assert {b.banner for b in selector.select_campaign_banners(7)} == {1, 2}
+
+    conn.close()
+
+
+def test_replica_refresh_changes_source():
+    """Reloading the replica hands out sketches for the new copy."""
+    start_replica()
+    try:
+        db = views.DBConnection()
+        with db:
+            sketches = views._click_sketches_for(db.source)
+        views._replica.refresh()
+        with db:
+            assert views._click_sketches_for(db.source) is not sketches
+    finally:
+        stop_replica()
+
+
+def test_campaign_falls_back_when_replica_stops(monkeypatch):
+    """A replica stopped mid-request falls back to the database file."""
+    stopped = SQLiteReplica("src/ads_campaigns/campaign.db")
+    monkeypatch.setattr(views, "_replica", stopped)
+
+    assert len(get_campaign(1)) >= 5
@@ -5,11 +5,17 @@ feel free to start splitting the tests, if you feel it is necessary.
 
 """
 
+import asyncio
+import sqlite3
+import threading
+import time
 from datetime import datetime
 
 import pytest
 
-from ads_campaigns.utils import get_hours_quarter
+from ads_campaigns.replica import SQLiteReplica
+from ads_campaigns.sketch import SpaceSaving
+from ads_campaigns.utils import SingleFlight, get_hours_quarter
 
 
 @pytest.mark.parametrize(
@@ -24,3 +30,224 @@ from ads_campaigns.utils import get_hours_quarter
 def test_get_hours_quarter(time, expected):
     """Test get_hour_quarter function."""
     assert get_hours_quarter(time) == expected
+
+
+def _wait_for_calls(flight, n, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while flight.stats.calls < n:
+        assert time.monotonic() < deadline, f"only {flight.stats.calls} of {n} calls"
+        time.sleep(0.001)
+
+
+def _join_all(threads, timeout=5.0):
+    for thread in threads:
+        thread.join(timeout)
+        assert not thread.is_alive(), "worker thread did not finish"
+
+
+def test_single_flight_coalesces_threads():
+    """Concurrent calls for one key run the function once."""
+    flight = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def slow():
+        runs.append(1)
+        release.wait()
+        return [1, 2, 3]
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do("k", slow)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        _wait_for_calls(flight, 8)
+    finally:
+        release.set()
+    _join_all(threads)
+
+    assert runs == [1]
+    assert results == [[1, 2, 3]] * 8
+    assert flight.stats == (8, 1, 7)
+
+
+def test_single_flight_coalesces_across_loops_and_threads():
+    """Coroutines on different event loops and threads share one call."""
+    flight = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def slow():
+        runs.append(1)
+        release.wait()
+        return "value"
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(asyncio.run(flight.ado("k", slow)))
+        )
+        for _ in range(3)
+    ]
+    threads.append(
+        threading.Thread(target=lambda: results.append(flight.do("k", slow)))
+    )
+    for thread in threads:
+        thread.start()
+    try:
+        _wait_for_calls(flight, 4)
+    finally:
+        release.set()
+    _join_all(threads)
+
+    assert runs == [1]
+    assert results == ["value"] * 4
+    assert flight.stats == (4, 1, 3)
+
+
+def test_single_flight_propagates_errors():
+    """Errors reach the caller and the key is not left in flight."""
+    flight = SingleFlight()
+
+    def boom():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        flight.do("k", boom)
+    assert flight.do("k", lambda: 42) == 42
+    assert flight.stats.coalesced == 0
+
+
+def test_single_flight_coalesces_coroutines():
+    """Concurrent coroutines for one key run the function once."""
+    flight = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def compute():
+        runs.append(1)
+        release.wait()
+        return "value"
+
+    async def main():
+        calls = asyncio.gather(*(flight.ado("k", compute) for _ in range(5)))
+        deadline = time.monotonic() + 5
+        try:
+            while flight.stats.calls < 5:
+                assert time.monotonic() < deadline, "coroutines never joined"
+                await asyncio.sleep(0.001)
+        finally:
+            release.set()
+        return await calls
+
+    assert asyncio.run(main()) == ["value"] * 5
+    assert runs == [1]
+    assert flight.stats == (5, 1, 4)
+
+
+def test_space_saving_exact_when_small():
+    """Counts are exact while distinct items fit in the sketch."""
+    sketch = SpaceSaving(epsilon=0.1)
+    sketch.extend([1, 1, 1, 2, 2, 3])
+
+    assert sketch.exact
+    assert sketch.top(2) == [(1, 3), (2, 2)]
+    assert sketch.top(2, exclude=[1]) == [(2, 2), (3, 1)]
+
+
+def test_space_saving_error_bound():
+    """Heavy hitters survive and counts stay within epsilon * total."""
+    epsilon = 0.05
+    sketch = SpaceSaving(epsilon)
+    stream = [0] * 500 + [1] * 300 + list(range(2, 1002))
+    sketch.extend(stream)
+
+    assert not sketch.exact
+    assert len(sketch.top(10_000)) == sketch.capacity
+    top = dict(sketch.top(2))
+    assert set(top) == {0, 1}
+    assert 500 <= top[0] <= 500 + epsilon * len(stream)
+    assert 300 <= top[1] <= 300 + epsilon * len(stream)
+
+
+def test_space_saving_invalid_epsilon():
+    """Epsilon must be a fraction."""
+    with pytest.raises(ValueError):
+        SpaceSaving(epsilon=0)
+
+
+def _make_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS clicks (click_id INTEGER)")
+    conn.executemany("INSERT INTO clicks VALUES (?)", [(i,) for i in rows])
+    conn.commit()
+    conn.close()
+
+
+def test_replica_refresh_swaps_copy(tmp_path):
+    """A refresh swaps in new data while open readers keep the old copy."""
+    path = str(tmp_path / "campaign.db")
+    _make_db(path, range(3))
+    replica = SQLiteReplica(path)
+    replica.refresh()
+
+    old = replica.connect()
+    _make_db(path, range(3, 5))
+    assert replica.is_stale()
+    replica.refresh()
+    new = replica.connect()
+
+    assert old.execute("SELECT COUNT(*) FROM clicks").fetchone() == (3,)
+    assert new.execute("SELECT COUNT(*) FROM clicks").fetchone() == (5,)
+    assert not replica.is_stale()
+    with pytest.raises(sqlite3.OperationalError):
+        new.execute("DELETE FROM clicks")
+
+    assert replica.connect_generation()[1] == replica.generation == 1
+    old.close()
+    new.close()
+    replica.stop()
+
+
+def test_replica_path_with_uri_characters(tmp_path):
+    """Paths are encoded before they are opened as URIs."""
+    path = str(tmp_path / "a?b#c%20.db")
+    _make_db(path, range(2))
+    replica = SQLiteReplica(path)
+    replica.refresh()
+
+    conn = replica.connect()
+    assert conn.execute("SELECT COUNT(*) FROM clicks").fetchone() == (2,)
+    conn.close()
+    replica.stop()
+
+
+def test_replica_sees_wal_writes(tmp_path):
+    """Writes still in the write-ahead log make the replica stale."""
+    path = str(tmp_path / "campaign.db")
+    _make_db(path, range(2))
+    writer = sqlite3.connect(path)
+    writer.execute("PRAGMA journal_mode = WAL")
+    writer.execute("PRAGMA wal_autocheckpoint = 0")
+    replica = SQLiteReplica(path)
+    replica.refresh()
+
+    writer.execute("INSERT INTO clicks VALUES (2)")
+    writer.commit()
+    assert replica.is_stale()
+    replica.refresh()
+
+    conn = replica.connect()
+    assert conn.execute("SELECT COUNT(*) FROM clicks").fetchone() == (3,)
+    conn.close()
+    writer.close()
+    replica.stop()
+
+
+def test_replica_not_loaded(tmp_path):
+    """Connecting before the first load is an error."""
+    with pytest.raises(RuntimeError):
+        SQLiteReplica(str(tmp_path / "campaign.db")).connect()